@@ -61,7 +61,8 @@ class TilesDataModule(LightningDataModule):
           - `CPU`: each transformed sample is saved to disk and, if cache_mode is `MEMORY`, reloaded into CPU;
           - `SAME`: each transformed sample is saved to disk and, if cache_mode is `MEMORY`, reloaded on the same device it was saved from;
         If cache_mode is `DISK` precache_location `CPU` and `GPU` are equivalent.
-        :param cache_dir: The directory onto which to cache data if caching is enabled.
+        :param cache_dir: The directory onto which to cache data if caching is enabled. If given, the parsed dataset
+        CSVs are also cached there by `get_splits()`.
         :param number_of_cross_validation_splits: Number of folds to perform.
         :param cross_validation_split_index: Index of the cross validation split to be performed.
         """
@@ -19,7 +19,7 @@ class PandaTilesDataModule(TilesDataModule):
         super().__init__(**kwargs)
 
     def get_splits(self) -> Tuple[PandaTilesDataset, PandaTilesDataset, PandaTilesDataset]:
-        dataset = PandaTilesDataset(self.root_path)
+        dataset = PandaTilesDataset(self.root_path, cache_dir=self.cache_dir)
         splits = DatasetSplits.from_proportions(dataset.dataset_df.reset_index(),
                                                 proportion_train=.8,
                                                 proportion_test=.1,
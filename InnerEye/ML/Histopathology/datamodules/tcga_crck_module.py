@@ -20,7 +20,7 @@ class TcgaCrckTilesDataModule(TilesDataModule):
         super().__init__(**kwargs)
 
     def get_splits(self) -> Tuple[TcgaCrck_TilesDataset, TcgaCrck_TilesDataset, TcgaCrck_TilesDataset]:
-        trainval_dataset = TcgaCrck_TilesDataset(self.root_path, train=True)
+        trainval_dataset = TcgaCrck_TilesDataset(self.root_path, train=True, cache_dir=self.cache_dir)
         splits = DatasetSplits.from_proportions(trainval_dataset.dataset_df.reset_index(),
                                                 proportion_train=0.8,
                                                 proportion_test=0.0,
@@ -35,4 +35,4 @@ class TcgaCrckTilesDataModule(TilesDataModule):
 
         return (TcgaCrck_TilesDataset(self.root_path, dataset_df=splits.train),
                 TcgaCrck_TilesDataset(self.root_path, dataset_df=splits.val),
-                TcgaCrck_TilesDataset(self.root_path, train=False))
+                TcgaCrck_TilesDataset(self.root_path, train=False, cache_dir=self.cache_dir))
@@ -3,6 +3,8 @@
 #  Licensed under the MIT License (MIT). See LICENSE in the repo root for license information.
 #  ------------------------------------------------------------------------------------------
 
+import hashlib
+import os
 from pathlib import Path
 from typing import Any, Dict, Optional, Tuple, Union
 
@@ -15,9 +17,34 @@ from torch.utils.data import Dataset
 from InnerEye.ML.Histopathology.utils.naming import SlideKey
 
 
+def _to_shareable_array(values: Union[pd.Series, pd.Index]) -> np.ndarray:
+    """Convert a dataframe column to a NumPy array, storing strings as fixed-width unicode instead of Python objects.
+
+    Forked DataLoader workers share the memory pages of the main process until they are written to. Merely reading
+    Python objects updates their reference counts, which gradually copies object arrays into every worker, whereas
+    arrays of plain values remain shared regardless of the number of workers.
+    """
+    array = values.to_numpy()
+    if array.dtype == object and pd.api.types.infer_dtype(values, skipna=False) == 'string':
+        return array.astype(str)
+    return array
+
+
+def _select_split(dataset_df: pd.DataFrame, split_column: Optional[str], split: str) -> pd.DataFrame:
+    """Select the rows of the given split.
+
+    The rows are filtered with a plain NumPy mask (no index alignment), before any further copies of the dataframe,
+    e.g. by `set_index()`, so that only the selected rows get copied.
+    """
+    return dataset_df[dataset_df[split_column].to_numpy() == split]
+
+
 class TilesDataset(Dataset):
     """Base class for datasets of WSI tiles, iterating dictionaries of image paths and metadata.
 
+    Samples are read from columns extracted when `dataset_df` is assigned, so the dataframe must not be modified in
+    place: assign a new dataframe instead, e.g. `dataset.dataset_df = dataset.dataset_df.loc[mask]`.
+
     :param TILE_ID_COLUMN: CSV column name for tile ID.
     :param SLIDE_ID_COLUMN: CSV column name for slide ID.
     :param IMAGE_COLUMN: CSV column name for relative path to image file.
@@ -26,6 +53,10 @@ class TilesDataset(Dataset):
     :param SPLIT_COLUMN: CSV column name for train/test split (optional).
     :param TILE_X_COLUMN: CSV column name for horizontal tile coordinate (optional).
     :param TILE_Y_COLUMN: CSV column name for vertical tile coordinate (optional).
+    :param EXTRA_COLUMNS: Names of additional CSV columns to include in the samples. If `None` (default), all
+    columns are kept; otherwise any other columns are dropped when loading the dataset.
+    :param CSV_DTYPES: Optional mapping of CSV column names to the dtypes used to parse them, e.g. `np.int32` for tile
+    coordinates. Columns not listed here have their types inferred, except for `IMAGE_COLUMN`, which is read as `str`.
     :param TRAIN_SPLIT_LABEL: Value used to indicate the training split in `SPLIT_COLUMN`.
     :param TEST_SPLIT_LABEL: Value used to indicate the test split in `SPLIT_COLUMN`.
     :param DEFAULT_CSV_FILENAME: Default name of the dataset CSV at the dataset rood directory.
@@ -40,6 +71,9 @@ class TilesDataset(Dataset):
     TILE_X_COLUMN: Optional[str] = 'tile_x'
     TILE_Y_COLUMN: Optional[str] = 'tile_y'
 
+    EXTRA_COLUMNS: Optional[Tuple[str, ...]] = None
+    CSV_DTYPES: Optional[Dict[str, Any]] = None
+
     TRAIN_SPLIT_LABEL: str = 'train'
     TEST_SPLIT_LABEL: str = 'test'
 
@@ -51,7 +85,8 @@ class TilesDataset(Dataset):
                  root: Union[str, Path],
                  dataset_csv: Optional[Union[str, Path]] = None,
                  dataset_df: Optional[pd.DataFrame] = None,
-                 train: Optional[bool] = None) -> None:
+                 train: Optional[bool] = None,
+                 cache_dir: Optional[Union[str, Path]] = None) -> None:
         """
         :param root: Root directory of the dataset.
         :param dataset_csv: Full path to a dataset CSV file, containing at least
@@ -61,41 +96,115 @@ class TilesDataset(Dataset):
         from the dataset CSV file, e.g. after some filtering. If given, overrides `dataset_csv`.
         :param train: If `True`, loads only the training split (resp. `False` for test split). By
         default (`None`), loads the entire dataset as-is.
+        :param cache_dir: Directory in which to cache the parsed dataset CSV, to speed up later loads.
+        By default (`None`), the CSV is parsed every time. Cached files are unpickled when loading,
+        so this should be a private directory rather than e.g. a shared dataset mount.
         """
         if self.SPLIT_COLUMN is None and train is not None:
             raise ValueError("Train/test split was specified but dataset has no split column")
 
         self.root_dir = Path(root)
+        self.cache_dir = None if cache_dir is None else Path(cache_dir)
+        split = None if train is None else self.TRAIN_SPLIT_LABEL if train else self.TEST_SPLIT_LABEL
 
         if dataset_df is not None:
             self.dataset_csv = None
+            available_columns = dataset_df.columns
         else:
-            self.dataset_csv = dataset_csv or self.root_dir / self.DEFAULT_CSV_FILENAME
-            dataset_df = pd.read_csv(self.dataset_csv)
+            csv_path = Path(dataset_csv or self.root_dir / self.DEFAULT_CSV_FILENAME)
+            self.dataset_csv = csv_path
+            # Only read the header for now, as the split column is needed to filter rows while parsing the CSV
+            available_columns = pd.read_csv(csv_path, nrows=0).columns
 
         columns = [self.SLIDE_ID_COLUMN, self.IMAGE_COLUMN, self.LABEL_COLUMN,
-                   self.SPLIT_COLUMN, self.TILE_X_COLUMN, self.TILE_Y_COLUMN]
-        for column in columns:
-            if column is not None and column not in dataset_df.columns:
-                raise ValueError(f"Expected column '{column}' not found in the dataframe")
-
-        dataset_df = dataset_df.set_index(self.TILE_ID_COLUMN)
-        if train is None:
-            self.dataset_df = dataset_df
+                   self.SPLIT_COLUMN, self.TILE_X_COLUMN, self.TILE_Y_COLUMN] + list(self.EXTRA_COLUMNS or ())
+        missing_columns = set(filter(None, columns)) - set(available_columns)
+        if missing_columns:
+            raise ValueError(f"Expected columns not found in the dataframe: {sorted(missing_columns)}")
+
+        if dataset_df is None:
+            # Rows read from the CSV are already filtered by split while parsing
+            dataset_df = self._read_dataset_csv(csv_path, split)
+        elif split is not None:
+            dataset_df = _select_split(dataset_df, self.SPLIT_COLUMN, split)
+
+        if self.EXTRA_COLUMNS is not None:
+            # Dropping unused columns early shrinks the dataframe, its extracted columns, and every sample
+            used_columns = dict.fromkeys([self.TILE_ID_COLUMN, *filter(None, columns)])
+            dataset_df = dataset_df[list(used_columns)]
+
+        self.dataset_df = dataset_df.set_index(self.TILE_ID_COLUMN)
+
+    def _read_dataset_csv(self, dataset_csv: Path, split: Optional[str] = None) -> pd.DataFrame:
+        """Load the dataset CSV, using a pickled copy of the parsed dataframe from `cache_dir` if available.
+
+        Parsing large tile CSVs is slow and would otherwise be repeated by every process using the
+        dataset. Caching is skipped if `cache_dir` is `None` or not writable, and any cached file
+        that cannot be loaded is ignored.
+
+        If a split is given, only its rows are loaded: the CSV is parsed in chunks that are filtered
+        as they are read, so that rows of other splits never accumulate in memory. Each split is then
+        cached separately.
+        """
+        # Explicit dtypes spare the parser from type inference and shrink the loaded dataframe
+        dtype = {self.IMAGE_COLUMN: str, **(self.CSV_DTYPES or {})}
+        cache_path = None if self.cache_dir is None else self._get_cache_path(dataset_csv, dtype, split)
+        if cache_path is not None and cache_path.is_file():
+            try:
+                return pd.read_pickle(cache_path)
+            except Exception:
+                pass  # e.g. truncated, or pickled by an incompatible pandas version: parse the CSV instead
+
+        if split is None:
+            dataset_df = pd.read_csv(dataset_csv, dtype=dtype)
         else:
-            split = self.TRAIN_SPLIT_LABEL if train else self.TEST_SPLIT_LABEL
-            self.dataset_df = dataset_df[dataset_df[self.SPLIT_COLUMN] == split]
+            chunks = pd.read_csv(dataset_csv, dtype=dtype, chunksize=100_000)
+            dataset_df = pd.concat([_select_split(chunk, self.SPLIT_COLUMN, split) for chunk in chunks], ignore_index=True)
+
+        if cache_path is not None:
+            # Write to a temporary file first, so that concurrent readers never see a partial pickle
+            tmp_cache_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+            try:
+                cache_path.parent.mkdir(parents=True, exist_ok=True)
+                dataset_df.to_pickle(tmp_cache_path)
+                os.replace(tmp_cache_path, cache_path)
+            except OSError:
+                if tmp_cache_path.exists():
+                    tmp_cache_path.unlink()
+        return dataset_df
+
+    def _get_cache_path(self, dataset_csv: Path, dtype: Dict[str, Any], split: Optional[str]) -> Path:
+        """Get the path of the cached dataframe, which changes with the CSV file and with the parsing settings."""
+        assert self.cache_dir is not None
+        csv_stat = dataset_csv.stat()
+        columns = (self.TILE_ID_COLUMN, self.SLIDE_ID_COLUMN, self.IMAGE_COLUMN, self.LABEL_COLUMN,
+                   self.SPLIT_COLUMN, self.TILE_X_COLUMN, self.TILE_Y_COLUMN)
+        cache_key = (str(dataset_csv.resolve()), csv_stat.st_size, csv_stat.st_mtime_ns, columns,
+                     sorted((column, repr(column_dtype)) for column, column_dtype in dtype.items()), split)
+        digest = hashlib.sha256(repr(cache_key).encode()).hexdigest()[:16]
+        return self.cache_dir / f"{dataset_csv.stem}.{digest}.pkl"
+
+    @property
+    def dataset_df(self) -> pd.DataFrame:
+        return self._dataset_df
+
+    @dataset_df.setter
+    def dataset_df(self, dataset_df: pd.DataFrame) -> None:
+        # Columns are extracted eagerly, so that forked DataLoader workers share them with the main process
+        self._dataset_df = dataset_df
+        self._tile_ids = _to_shareable_array(dataset_df.index)
+        # Joining paths once here avoids creating `Path` objects for every sample
+        image_paths = np.array([str(self.root_dir / path) for path in dataset_df[self.IMAGE_COLUMN]], dtype=str)
+        self._columns = {column: image_paths if column == self.IMAGE_COLUMN else _to_shareable_array(dataset_df[column])
+                         for column in dataset_df.columns}
 
     def __len__(self) -> int:
-        return self.dataset_df.shape[0]
+        return len(self._tile_ids)
 
     def __getitem__(self, index: int) -> Dict[str, Any]:
-        tile_id = self.dataset_df.index[index]
-        sample = {
-            self.TILE_ID_COLUMN: tile_id,
-            **self.dataset_df.loc[tile_id].to_dict()
-        }
-        sample[self.IMAGE_COLUMN] = str(self.root_dir / sample.pop(self.IMAGE_COLUMN))
+        # ndarray.item() returns native Python values, as Series.to_dict() did
+        sample = {self.TILE_ID_COLUMN: self._tile_ids.item(index)}
+        sample.update((column, values.item(index)) for column, values in self._columns.items())
         # we're replicating this column because we want to propagate the path to the batch
         sample[self.PATH_COLUMN] = sample[self.IMAGE_COLUMN]
         return sample
@@ -105,7 +214,22 @@ class TilesDataset(Dataset):
         return self.dataset_df[self.SLIDE_ID_COLUMN]
 
     def get_slide_labels(self) -> pd.Series:
-        return self.dataset_df.groupby(self.SLIDE_ID_COLUMN)[self.LABEL_COLUMN].agg(pd.Series.mode)
+        """Get the most frequent tile label for each slide, indexed by sorted slide ID.
+
+        The per-slide mode is computed via a vectorised label count instead of a `groupby().agg()`
+        callback per slide, which is very slow for large tile datasets. Ties are resolved in favour
+        of the smallest label. Slides whose tile labels are all missing are left out.
+        """
+        slide_codes, slide_ids = pd.factorize(self.dataset_df[self.SLIDE_ID_COLUMN], sort=True)
+        label_codes, labels = pd.factorize(self.dataset_df[self.LABEL_COLUMN], sort=True)
+        valid = (slide_codes >= 0) & (label_codes >= 0)  # factorize() encodes missing values as -1
+        n_slides, n_labels = len(slide_ids), len(labels)
+        counts = np.bincount(slide_codes[valid] * n_labels + label_codes[valid], minlength=n_slides * n_labels)
+        counts = counts.reshape(n_slides, n_labels)
+        labelled = counts.sum(axis=1) > 0  # otherwise argmax() would pick the first label
+        label_indices = counts[labelled].argmax(axis=1) if n_labels > 0 else np.array([], dtype=int)
+        slide_index = pd.Index(slide_ids[labelled], name=self.SLIDE_ID_COLUMN)
+        return pd.Series(labels[label_indices], index=slide_index, name=self.LABEL_COLUMN)
 
     def get_class_weights(self) -> torch.Tensor:
         slide_labels = self.get_slide_labels()
@@ -117,7 +241,9 @@ class TilesDataset(Dataset):
 class SlidesDataset(Dataset):
     """Base class for datasets of WSIs, iterating dictionaries of image paths and metadata.
 
-    The output dictionaries are indexed by `..utils.naming.SlideKey`.
+    The output dictionaries are indexed by `..utils.naming.SlideKey`. Samples are read from columns extracted by
+    `validate_columns()`, and again whenever `dataset_df` is assigned afterwards, so the dataframe must not be
+    modified in place once validated: assign a new dataframe instead.
 
     :param SLIDE_ID_COLUMN: CSV column name for slide ID.
     :param IMAGE_COLUMN: CSV column name for relative path to image file.
@@ -164,19 +290,20 @@ class SlidesDataset(Dataset):
             raise ValueError("Train/test split was specified but dataset has no split column")
 
         self.root_dir = Path(root)
+        self._columns_extracted = False
 
         if dataset_df is not None:
             self.dataset_csv = None
         else:
             self.dataset_csv = dataset_csv or self.root_dir / self.DEFAULT_CSV_FILENAME
-            dataset_df = pd.read_csv(self.dataset_csv)
+            # Path columns are parsed as plain strings; other columns may still be derived by subclasses
+            path_columns = [self.IMAGE_COLUMN, self.MASK_COLUMN]
+            dataset_df = pd.read_csv(self.dataset_csv, dtype={column: str for column in path_columns if column})
 
-        dataset_df = dataset_df.set_index(self.SLIDE_ID_COLUMN)
-        if train is None:
-            self.dataset_df = dataset_df
-        else:
+        if train is not None:
             split = self.TRAIN_SPLIT_LABEL if train else self.TEST_SPLIT_LABEL
-            self.dataset_df = dataset_df[dataset_df[self.SPLIT_COLUMN] == split]
+            dataset_df = _select_split(dataset_df, self.SPLIT_COLUMN, split)
+        self.dataset_df = dataset_df.set_index(self.SLIDE_ID_COLUMN)
 
         if validate_columns:
             self.validate_columns()
@@ -185,34 +312,57 @@ class SlidesDataset(Dataset):
         """Check that loaded dataframe contains expected columns, raises `ValueError` otherwise.
 
         If the constructor is overloaded in a subclass, you can pass `validate_columns=False` and
-        call `validate_columns()` after creating derived columns, for example.
+        call `validate_columns()` after creating derived columns, for example. The columns used in
+        samples are then extracted from the validated dataframe.
         """
         columns = [self.IMAGE_COLUMN, self.LABEL_COLUMN, self.MASK_COLUMN,
                    self.SPLIT_COLUMN] + list(self.METADATA_COLUMNS)
-        for column in columns:
-            if column is not None and column not in self.dataset_df.columns:
-                raise ValueError(f"Expected column '{column}' not found in the dataframe")
+        missing_columns = set(filter(None, columns)) - set(self.dataset_df.columns)
+        if missing_columns:
+            raise ValueError(f"Expected columns not found in the dataframe: {sorted(missing_columns)}")
+        self._extract_columns()
+
+    @property
+    def dataset_df(self) -> pd.DataFrame:
+        return self._dataset_df
+
+    @dataset_df.setter
+    def dataset_df(self, dataset_df: pd.DataFrame) -> None:
+        self._dataset_df = dataset_df
+        # Before the first validation, subclasses may still be deriving columns in place
+        if self._columns_extracted:
+            self.validate_columns()
+
+    def _extract_columns(self) -> None:
+        # Columns are extracted eagerly, so that forked DataLoader workers share them with the main process
+        self._slide_ids = _to_shareable_array(self.dataset_df.index)
+        # Joining paths once here avoids creating `Path` objects for every sample
+        self._image_paths = np.array([str(self.root_dir / path) for path in self.dataset_df[self.IMAGE_COLUMN]],
+                                     dtype=str)
+        mask_paths = self.dataset_df[self.MASK_COLUMN] if self.MASK_COLUMN else []
+        self._mask_paths = np.array([str(self.root_dir / path) for path in mask_paths], dtype=str)
+        self._labels = _to_shareable_array(self.dataset_df[self.LABEL_COLUMN])
+        self._metadata_columns = {column: _to_shareable_array(self.dataset_df[column])
+                                  for column in self.METADATA_COLUMNS}
+        self._columns_extracted = True
 
     def __len__(self) -> int:
-        return self.dataset_df.shape[0]
+        return len(self._slide_ids)
 
     def __getitem__(self, index: int) -> Dict[SlideKey, Any]:
-        slide_id = self.dataset_df.index[index]
-        slide_row = self.dataset_df.loc[slide_id]
-        sample = {SlideKey.SLIDE_ID: slide_id}
+        # ndarray.item() returns native Python values, as Series.to_dict() did
+        sample = {SlideKey.SLIDE_ID: self._slide_ids.item(index)}
 
-        rel_image_path = slide_row[self.IMAGE_COLUMN]
-        sample[SlideKey.IMAGE] = str(self.root_dir / rel_image_path)
+        sample[SlideKey.IMAGE] = self._image_paths.item(index)
         # we're replicating this column because we want to propagate the path to the batch
         sample[SlideKey.IMAGE_PATH] = sample[SlideKey.IMAGE]
 
         if self.MASK_COLUMN:
-            rel_mask_path = slide_row[self.MASK_COLUMN]
-            sample[SlideKey.MASK] = str(self.root_dir / rel_mask_path)
+            sample[SlideKey.MASK] = self._mask_paths.item(index)
             sample[SlideKey.MASK_PATH] = sample[SlideKey.MASK]
 
-        sample[SlideKey.LABEL] = slide_row[self.LABEL_COLUMN]
-        sample[SlideKey.METADATA] = {col: slide_row[col] for col in self.METADATA_COLUMNS}
+        sample[SlideKey.LABEL] = self._labels.item(index)
+        sample[SlideKey.METADATA] = {column: values.item(index) for column, values in self._metadata_columns.items()}
         return sample
 
     @classmethod
@@ -6,6 +6,7 @@
 from pathlib import Path
 from typing import Any, Callable, Optional, Tuple, Union
 
+import numpy as np
 import pandas as pd
 from torchvision.datasets.vision import VisionDataset
 
@@ -29,6 +30,8 @@ class PandaTilesDataset(TilesDataset):
     LABEL_COLUMN = "slide_isup_grade"
     SPLIT_COLUMN = None  # PANDA does not have an official train/test split
     N_CLASSES = 6
+    # The tiling script always writes integer coordinates and ISUP grades (0-5)
+    CSV_DTYPES = {'tile_x': np.int32, 'tile_y': np.int32, LABEL_COLUMN: np.int8}
 
     _RELATIVE_ROOT_FOLDER = Path("PANDA_tiles_20210926-135446/panda_tiles_level1_224")
 
@@ -36,11 +39,13 @@ class PandaTilesDataset(TilesDataset):
                  root: Path,
                  dataset_csv: Optional[Union[str, Path]] = None,
                  dataset_df: Optional[pd.DataFrame] = None,
-                 occupancy_threshold: Optional[float] = None) -> None:
+                 occupancy_threshold: Optional[float] = None,
+                 cache_dir: Optional[Union[str, Path]] = None) -> None:
         super().__init__(root=Path(root) / self._RELATIVE_ROOT_FOLDER,
                          dataset_csv=dataset_csv,
                          dataset_df=dataset_df,
-                         train=None)
+                         train=None,
+                         cache_dir=cache_dir)
         if occupancy_threshold is not None:
             dataset_df_filtered = self.dataset_df.loc[self.dataset_df['occupancy'] > occupancy_threshold]  # type: ignore
             self.dataset_df = dataset_df_filtered
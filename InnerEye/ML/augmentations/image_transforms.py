@@ -31,10 +31,10 @@ class RandomGamma:
         gamma = random.uniform(*self.scale)
         if len(image.shape) != 4:
             raise ValueError(f"Expected input of shape [Z, C, H, W], but only got {len(image.shape)} dimensions")
-        for z in range(image.shape[0]):
-            for c in range(image.shape[1]):
-                image[z, c] = torchvision.transforms.functional.adjust_gamma(image[z, c], gamma=gamma)
-        return image
+        # The gamma correction is pixel-wise, so all slices and channels are transformed in a single call. They are
+        # stacked as single-channel images, because adjust_gamma only accepts 1 or 3 channels.
+        slices = image.reshape(-1, 1, *image.shape[-2:])
+        return torchvision.transforms.functional.adjust_gamma(slices, gamma=gamma).reshape(image.shape)
 
 
 class ExpandChannels:
@@ -69,9 +69,9 @@ class AddGaussianNoise:
     def __call__(self, data: torch.Tensor) -> torch.Tensor:
         if np.random.random(1) > self.p_apply:
             return data
-        noise = torch.randn(size=data.shape[-2:]) * self.std
-        data = torch.clamp(data + noise, data.min(), data.max())  # type: ignore
-        return data
+        noise = torch.randn(size=data.shape[-2:], device=data.device) * self.std
+        # Clamp the freshly allocated sum in place, rather than allocating another tensor for the result
+        return (data + noise).clamp_(data.min(), data.max())  # type: ignore
 
 
 class ElasticTransform:
@@ -101,16 +101,17 @@ class ElasticTransform:
     def __call__(self, data: torch.Tensor) -> torch.Tensor:
         if np.random.random(1) > self.p_apply:
             return data
-        result_type = data.dtype
+        result_type, result_device = data.dtype, data.device
         data = data.cpu().numpy()
         shape = data.shape
 
         dx = gaussian_filter((np.random.random(shape[-2:]) * 2 - 1), self.sigma, mode="constant", cval=0) * self.alpha
         dy = gaussian_filter((np.random.random(shape[-2:]) * 2 - 1), self.sigma, mode="constant", cval=0) * self.alpha
-        all_dimensions_axes = [np.arange(dim) for dim in shape]
-        grid = np.meshgrid(*all_dimensions_axes, indexing='ij')
-        grid[-2] = grid[-2] + dx
-        grid[-1] = grid[-1] + dy
-        indices = [np.reshape(grid[i], (-1, 1)) for i in range(len(grid))]
-
-        return torch.tensor(map_coordinates(data, indices, order=1).reshape(shape), dtype=result_type)
+        # All 2D slices share the same displacement field, so interpolate each slice in 2D: leading axes would only
+        # be sampled at integer positions, but still double the interpolation work per axis when done jointly.
+        grid_x, grid_y = np.meshgrid(np.arange(shape[-2]), np.arange(shape[-1]), indexing='ij')
+        indices = np.stack([np.reshape(grid_x + dx, -1), np.reshape(grid_y + dy, -1)])
+        transformed = np.stack([map_coordinates(image_slice, indices, order=1)
+                                for image_slice in data.reshape(-1, *shape[-2:])])
+
+        return torch.tensor(transformed.reshape(shape), dtype=result_type, device=result_device)
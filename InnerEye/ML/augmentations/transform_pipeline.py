@@ -52,11 +52,9 @@ class ImageTransformationPipeline:
 
         :param image: batch of tensor images of size [C, Z, Y, X] or batch of 2D images as PIL Image
         """
-
-        def _convert_to_tensor_if_necessary(data: ImageData) -> torch.Tensor:
-            return to_tensor(data) if isinstance(data, PIL.Image.Image) else data
-
-        image = _convert_to_tensor_if_necessary(image)
+        # The transforms all operate on tensors, hence they also return tensors: converting once here is sufficient
+        if isinstance(image, PIL.Image.Image):
+            image = to_tensor(image)
         original_input_is_2d = len(image.shape) == 3
         # If we have a 2D image [C, H, W] expand to [Z, C, H, W]. Build-in torchvision transforms allow such 4D inputs.
         if original_input_is_2d:
@@ -70,17 +68,17 @@ class ImageTransformationPipeline:
             image = torch.transpose(image, 1, 0)
 
         if not self.use_different_transformation_per_channel:
-            image = _convert_to_tensor_if_necessary(self.pipeline(image))
+            image = self.pipeline(image)
         else:
-            channels = []
-            for channel in range(image.shape[1]):
-                channels.append(_convert_to_tensor_if_necessary(self.pipeline(image[:, channel, :, :].unsqueeze(1))))
+            # Torchvision transforms draw a single set of random parameters per call, so each channel
+            # needs its own call. split() returns [Z, 1, H, W] views without any indexing or copies.
+            channels = [self.pipeline(channel) for channel in image.split(1, dim=1)]
             image = torch.cat(channels, dim=1)
         # Back to [C, Z, H, W]
         image = torch.transpose(image, 1, 0)
         if original_input_is_2d:
             image = image.squeeze(1)
-        return image.to(dtype=image.dtype)
+        return image
 
     def __call__(self, data: ImageData) -> torch.Tensor:
         return self.transform_image(data)
@@ -93,6 +91,8 @@ def create_transforms_from_config(config: CfgNode,
     Defines the image transformations pipeline from a config file. It has been designed for Chest X-Ray
     images but it can be used for other types of images data, type of augmentations to use and strength are
     expected to be defined in the config. The channel expansion is needed for gray images.
+    All transformations operate on tensors: PIL images are converted once, when entering the
+    `ImageTransformationPipeline`, so the pipeline contains no PIL-based transforms nor a final `ToTensor()`.
     :param config: config yaml file fixing strength and type of augmentation to apply
     :param apply_augmentations: if True return transformation pipeline with augmentations. Else,
     disable augmentations i.e. only resize and center crop the image.
@@ -3,6 +3,7 @@
 #  Licensed under the MIT License (MIT). See LICENSE in the repo root for license information.
 #  ------------------------------------------------------------------------------------------
 import random
+from typing import Callable, List
 
 import numpy as np
 import pytest
@@ -94,3 +95,19 @@ def test_random_gamma() -> None:
     human_readable_transformed = to_pil_image(RandomGamma(scale=(2, 3))(test_image_as_tensor).squeeze(0))
     expected_pil_image = Image.open(full_ml_test_data_path() / "gamma_transformed_image_and_contour.png").convert("RGB")
     assert expected_pil_image == human_readable_transformed
+
+
+@pytest.mark.gpu
+def test_transforms_on_gpu() -> None:
+    """
+    Tests that the custom transforms can be applied to tensors that are already on the GPU, and keep them there.
+    """
+    image = test_tensor_2channels_2slices.clone().cuda()
+    transforms: List[Callable[[torch.Tensor], torch.Tensor]] = [AddGaussianNoise(std=0.05, p_apply=1),
+                                                                ElasticTransform(sigma=4, alpha=34, p_apply=1),
+                                                                ExpandChannels(),
+                                                                RandomGamma(scale=(0.3, 3))]
+    for transform in transforms:
+        input_image = image[:, :1] if isinstance(transform, ExpandChannels) else image.clone()
+        transformed = transform(input_image)
+        assert transformed.device == image.device
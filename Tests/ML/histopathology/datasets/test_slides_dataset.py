@@ -38,3 +38,14 @@ def test_slides_dataset() -> None:
     metadata = sample[SlideKey.METADATA]
     assert isinstance(metadata, dict)
     assert all(meta_col in metadata for meta_col in type(dataset).METADATA_COLUMNS)
+
+
+def test_slides_dataset_reassign_dataset_df() -> None:
+    dataset = MockSlidesDataset()
+    first_slide_id = dataset[0][SlideKey.SLIDE_ID]
+    # Samples reflect a dataframe that was replaced after construction, e.g. by filtering
+    dataset.dataset_df = dataset.dataset_df.assign(**{dataset.LABEL_COLUMN: 1}).iloc[:1]
+    assert len(dataset) == 1
+    sample = dataset[0]
+    assert sample[SlideKey.SLIDE_ID] == first_slide_id
+    assert sample[SlideKey.LABEL] == 1
@@ -0,0 +1,194 @@
+#  ------------------------------------------------------------------------------------------
+#  Copyright (c) Microsoft Corporation. All rights reserved.
+#  Licensed under the MIT License (MIT). See LICENSE in the repo root for license information.
+#  ------------------------------------------------------------------------------------------
+
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+from sklearn.utils.class_weight import compute_class_weight
+
+from InnerEye.ML.Histopathology.datasets.base_dataset import TilesDataset
+
+
+class MockTilesDataset(TilesDataset):
+    TILE_X_COLUMN = TILE_Y_COLUMN = None
+
+
+def generate_mock_dataset_df(n_tiles: int, overrides: Optional[Dict[Optional[str], Any]] = None) -> pd.DataFrame:
+    df = pd.DataFrame({
+        MockTilesDataset.TILE_ID_COLUMN: [f"tile{i}" for i in range(n_tiles)],
+        MockTilesDataset.SLIDE_ID_COLUMN: range(n_tiles),
+        MockTilesDataset.LABEL_COLUMN: 0,
+        MockTilesDataset.SPLIT_COLUMN: MockTilesDataset.TRAIN_SPLIT_LABEL,
+        MockTilesDataset.IMAGE_COLUMN: [f"{i}.png" for i in range(n_tiles)]
+    })
+    for column, values in (overrides or {}).items():
+        df[column] = values
+    return df
+
+
+def test_get_slide_labels() -> None:
+    df = generate_mock_dataset_df(7, {MockTilesDataset.SLIDE_ID_COLUMN: ['c', 'c', 'a', 'a', 'a', 'b', 'b'],
+                                      MockTilesDataset.LABEL_COLUMN: [2, 2, 1, 0, 1, 0, 1]})
+    dataset = MockTilesDataset(root="", dataset_df=df)
+    slide_labels = dataset.get_slide_labels()
+    assert slide_labels.index.name == MockTilesDataset.SLIDE_ID_COLUMN
+    # Most frequent label per slide, with ties resolved in favour of the smallest label
+    assert slide_labels.to_dict() == {'a': 1, 'b': 0, 'c': 2}
+
+
+def test_get_slide_labels_missing() -> None:
+    df = generate_mock_dataset_df(3, {MockTilesDataset.SLIDE_ID_COLUMN: ['a', 'a', 'b'],
+                                      MockTilesDataset.LABEL_COLUMN: [np.nan, 1, np.nan]})
+    dataset = MockTilesDataset(root="", dataset_df=df)
+    # Slides without any labelled tile get no label, rather than an arbitrary one
+    assert dataset.get_slide_labels().to_dict() == {'a': 1}
+
+    dataset.dataset_df = dataset.dataset_df.assign(**{MockTilesDataset.LABEL_COLUMN: np.nan})
+    assert dataset.get_slide_labels().empty
+
+
+def test_tiles_dataset_getitem() -> None:
+    df = generate_mock_dataset_df(4, {MockTilesDataset.SLIDE_ID_COLUMN: ['a', 'a', 'b', 'b'],
+                                      MockTilesDataset.LABEL_COLUMN: [0, 0, 1, 1],
+                                      MockTilesDataset.SPLIT_COLUMN: ['train', 'test', 'train', 'test'],
+                                      'extra': [0.1, 0.2, 0.3, 0.4]})
+    dataset = MockTilesDataset(root="/root", dataset_df=df)
+    assert len(dataset) == len(df)
+    sample = dataset[2]
+    assert sample == {MockTilesDataset.TILE_ID_COLUMN: 'tile2',
+                      MockTilesDataset.SLIDE_ID_COLUMN: 'b',
+                      MockTilesDataset.LABEL_COLUMN: 1,
+                      MockTilesDataset.SPLIT_COLUMN: 'train',
+                      MockTilesDataset.IMAGE_COLUMN: str(Path("/root/2.png")),
+                      MockTilesDataset.PATH_COLUMN: str(Path("/root/2.png")),
+                      'extra': 0.3}
+
+    # Samples must reflect a dataframe that was replaced after construction, e.g. by filtering
+    dataset.dataset_df = dataset.dataset_df.iloc[1::2]
+    assert len(dataset) == 2
+    assert dataset[1][MockTilesDataset.TILE_ID_COLUMN] == 'tile3'
+
+
+def test_get_class_weights() -> None:
+    slide_labels = [0, 0, 0, 1, 2, 2]
+    df = generate_mock_dataset_df(len(slide_labels), {MockTilesDataset.LABEL_COLUMN: slide_labels})
+    dataset = MockTilesDataset(root="", dataset_df=df)
+    expected_weights = compute_class_weight(class_weight='balanced', classes=np.unique(slide_labels), y=slide_labels)
+    assert torch.allclose(dataset.get_class_weights(), torch.as_tensor(expected_weights))
+
+
+def test_missing_columns() -> None:
+    df = generate_mock_dataset_df(2).drop(columns=[MockTilesDataset.LABEL_COLUMN, MockTilesDataset.SPLIT_COLUMN])
+    with pytest.raises(ValueError) as ex:
+        MockTilesDataset(root="", dataset_df=df)
+    # All missing columns are reported at once
+    assert str([MockTilesDataset.LABEL_COLUMN, MockTilesDataset.SPLIT_COLUMN]) in str(ex.value)
+
+
+@pytest.mark.parametrize('train', [True, False])
+def test_tiles_dataset_split(train: bool) -> None:
+    splits = ['train', 'test', 'test', 'train', 'train']
+    df = generate_mock_dataset_df(len(splits), {MockTilesDataset.SPLIT_COLUMN: splits})
+    dataset = MockTilesDataset(root="", dataset_df=df, train=train)
+    expected_split = MockTilesDataset.TRAIN_SPLIT_LABEL if train else MockTilesDataset.TEST_SPLIT_LABEL
+    expected_tile_ids = [f"tile{i}" for i, split in enumerate(splits) if split == expected_split]
+    assert dataset.dataset_df.index.name == MockTilesDataset.TILE_ID_COLUMN
+    assert list(dataset.dataset_df.index) == expected_tile_ids
+    assert [dataset[i][MockTilesDataset.TILE_ID_COLUMN] for i in range(len(dataset))] == expected_tile_ids
+
+
+def test_extra_columns() -> None:
+    df = generate_mock_dataset_df(2, {'occupancy': [0.5, 0.7], 'unused': ['foo', 'bar']})
+
+    class MockTilesDatasetWithExtraColumns(MockTilesDataset):
+        EXTRA_COLUMNS = ('occupancy',)
+
+    all_columns_dataset = MockTilesDataset(root="", dataset_df=df)
+    assert 'unused' in all_columns_dataset.dataset_df.columns
+    assert 'unused' in all_columns_dataset[0]
+
+    dataset = MockTilesDatasetWithExtraColumns(root="", dataset_df=df)
+    assert list(dataset.dataset_df.columns) == [MockTilesDataset.SLIDE_ID_COLUMN, MockTilesDataset.IMAGE_COLUMN,
+                                                MockTilesDataset.LABEL_COLUMN, MockTilesDataset.SPLIT_COLUMN,
+                                                'occupancy']
+    sample = dataset[1]
+    assert sample['occupancy'] == 0.7
+    assert 'unused' not in sample
+
+
+def test_tiles_dataset_from_csv(tmp_path: Path) -> None:
+    splits = ['train', 'test', 'test', 'train', 'train']
+    df = generate_mock_dataset_df(len(splits), {MockTilesDataset.LABEL_COLUMN: [0, 1, 0, 1, 0],
+                                                MockTilesDataset.SPLIT_COLUMN: splits})
+    df.to_csv(tmp_path / MockTilesDataset.DEFAULT_CSV_FILENAME, index=False)
+    cache_dir = tmp_path / "cache"
+
+    for _ in range(2):  # The second time, datasets are loaded from the cached dataframes
+        full_dataset = MockTilesDataset(root=tmp_path, cache_dir=cache_dir)
+        assert list(full_dataset.dataset_df.index) == list(df[MockTilesDataset.TILE_ID_COLUMN])
+        for train in [True, False]:
+            dataset = MockTilesDataset(root=tmp_path, train=train, cache_dir=cache_dir)
+            expected_df = MockTilesDataset(root=tmp_path, dataset_df=df, train=train).dataset_df
+            pd.testing.assert_frame_equal(dataset.dataset_df, expected_df, check_dtype=False)
+    assert len(list(cache_dir.glob("*.pkl"))) == 3  # full dataset, train and test splits
+    assert not list(tmp_path.glob("*.pkl"))  # nothing is written next to the CSV
+
+
+def test_tiles_dataset_csv_cache(tmp_path: Path) -> None:
+    csv_path = tmp_path / MockTilesDataset.DEFAULT_CSV_FILENAME
+    cache_dir = tmp_path / "cache"
+    generate_mock_dataset_df(3).to_csv(csv_path, index=False)
+    assert len(MockTilesDataset(root=tmp_path, cache_dir=cache_dir)) == 3
+
+    # The cache key includes the parsing settings, so subclasses never get each other's dataframes
+    class MockTilesDatasetWithDtypes(MockTilesDataset):
+        CSV_DTYPES = {MockTilesDataset.SLIDE_ID_COLUMN: np.int16}
+
+    typed_dataset = MockTilesDatasetWithDtypes(root=tmp_path, cache_dir=cache_dir)
+    assert typed_dataset.dataset_df[MockTilesDataset.SLIDE_ID_COLUMN].dtype == np.int16
+
+    # A replaced CSV is parsed again, even if its modification time is older than the cached file
+    csv_stat = csv_path.stat()
+    generate_mock_dataset_df(1).to_csv(csv_path, index=False)
+    os.utime(csv_path, ns=(csv_stat.st_atime_ns, csv_stat.st_mtime_ns - 1_000_000_000))
+    assert len(MockTilesDataset(root=tmp_path, cache_dir=cache_dir)) == 1
+
+    # Unreadable cached files are ignored
+    for cache_path in cache_dir.glob("*.pkl"):
+        cache_path.write_bytes(b"corrupted")
+    assert len(MockTilesDataset(root=tmp_path, cache_dir=cache_dir)) == 1
+
+
+def test_tiles_dataset_csv_dtypes(tmp_path: Path) -> None:
+    df = generate_mock_dataset_df(3, {MockTilesDataset.LABEL_COLUMN: ['MSS', 'MSIMUT', None]})
+    df.to_csv(tmp_path / MockTilesDataset.DEFAULT_CSV_FILENAME, index=False)
+    # Labels are not typed by default, so string and missing labels are loaded as in a dataframe
+    dataset = MockTilesDataset(root=tmp_path)
+    assert dataset.dataset_df[MockTilesDataset.LABEL_COLUMN].iloc[:2].tolist() == ['MSS', 'MSIMUT']
+
+
+def test_tiles_dataset_csv_split(tmp_path: Path) -> None:
+    df = generate_mock_dataset_df(2, {MockTilesDataset.SPLIT_COLUMN: ['train', 'test'], 'fold': ['test', 'train']})
+    df.to_csv(tmp_path / MockTilesDataset.DEFAULT_CSV_FILENAME, index=False)
+    cache_dir = tmp_path / "cache"
+
+    class MockTilesDatasetWithFolds(MockTilesDataset):
+        SPLIT_COLUMN = 'fold'
+
+    # Cached splits are not shared between datasets using different split columns
+    assert list(MockTilesDataset(root=tmp_path, train=True, cache_dir=cache_dir).dataset_df.index) == ['tile0']
+    assert list(MockTilesDatasetWithFolds(root=tmp_path, train=True, cache_dir=cache_dir).dataset_df.index) == ['tile1']
+
+    class MockTilesDatasetWithMissingSplit(MockTilesDataset):
+        SPLIT_COLUMN = 'missing_split'
+
+    # Missing columns are reported before the CSV rows are parsed and filtered by split
+    with pytest.raises(ValueError, match="missing_split"):
+        MockTilesDatasetWithMissingSplit(root=tmp_path, train=True)